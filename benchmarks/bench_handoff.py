@@ -0,0 +1,86 @@
+"""
+Usage: bench_handoff.py [options]
+
+Measure how many events/sec can be passed from the reader process to the
+uploading process, comparing one `Event` per queue item against
+`EventChunk`s as used by `log_entry_producer`.
+
+Options:
+  --events NUM         Number of events to pass. [default: 200000]
+  --chunk-size NUM     Events in a chunk. [default: 1000]
+"""
+import datetime
+import multiprocessing as mp
+import time
+
+import docopt
+
+from metsuri.log_uploader import EOF, Event, EventChunk, EVENT_QUEUE_DEPTH
+
+
+def make_events(count):
+    start = datetime.datetime(2021, 1, 24, tzinfo=datetime.timezone.utc)
+    return [Event(start + datetime.timedelta(milliseconds=ii),
+                  f"kernel: line {ii} of the benchmark workload, some more text",
+                  1234, 80 * ii)
+            for ii in range(count)]
+
+
+def single_producer(q, count):
+    for ev in make_events(count):
+        q.put(ev)
+    q.put(EOF())
+
+
+def chunk_producer(q, count, chunk_size):
+    chunk = EventChunk()
+    for ev in make_events(count):
+        chunk.append(ev)
+        if len(chunk) >= chunk_size:
+            q.put(chunk)
+            chunk = EventChunk()
+    if chunk:
+        q.put(chunk)
+    q.put(EOF())
+
+
+def consume(q, chunked):
+    received = 0
+    while True:
+        item = q.get()
+        if isinstance(item, EOF):
+            return received
+        if chunked:
+            for _ in item:
+                received += 1
+        else:
+            received += 1
+
+
+def events_per_second(ctx, target, args, chunked, maxsize=0):
+    q = ctx.Queue(maxsize=maxsize)
+    producer = ctx.Process(target=target, args=(q,) + args)
+    start = time.perf_counter()
+    producer.start()
+    received = consume(q, chunked)
+    elapsed = time.perf_counter() - start
+    producer.join()
+    return received / elapsed
+
+
+def main():
+    opts = docopt.docopt(__doc__)
+    count = int(opts['--events'])
+    chunk_size = int(opts['--chunk-size'])
+    ctx = mp.get_context('spawn')
+
+    # Event creation in the producer is included in both measurements.
+    before = events_per_second(ctx, single_producer, (count,), False)
+    after = events_per_second(ctx, chunk_producer, (count, chunk_size), True,
+                              maxsize=EVENT_QUEUE_DEPTH)
+    print(f"handoff: before {before:,.0f} events/s, "
+          f"after {after:,.0f} events/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Usage: bench_parse.py [options]
+
+Measure `parse_log_line` throughput in lines/sec, comparing the current
+parser against the previous regex-only implementation.
+
+The workload imitates a day of serial output as written by the
+`serial-logger` on a Raspberry Pi: lines of 20-120 characters prefixed with
+the fixed width UTC timestamp of `LogFile.format_line`. A second workload with
+legacy, localtime timestamps exercises the fallback path.
+
+Options:
+  --lines NUM          Number of lines in the workload. [default: 200000]
+  --repeat NUM         Take the best of NUM runs. [default: 3]
+"""
+import datetime
+import random
+import re
+import time
+from typing import Callable, List, Optional
+
+import docopt
+
+from metsuri.log_uploader import Event, parse_log_line
+
+
+def legacy_parse_log_line(line: Optional[str]) -> Optional[Event]:
+    # parse_log_line as it was before the fast path was added.
+    if line is None:
+        return None
+
+    m = re.search(r"(?P<timestamp>\d+-\d+-\d+[T ]\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}:\d{2})?)]?:? ?(?P<msg>.*$)", line)
+    if m is None:
+        return None
+
+    try:
+        dt = datetime.datetime.fromisoformat(m.group("timestamp"))
+    except ValueError:
+        return None
+
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return Event(timestamp=dt, message=m.group("msg"))
+
+
+def generate_lines(count: int, legacy: bool = False) -> List[str]:
+    rng = random.Random(1)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 :=[]"
+    ts = datetime.datetime(2021, 1, 24, tzinfo=datetime.timezone.utc)
+    lines = []
+    for _ in range(count):
+        ts += datetime.timedelta(milliseconds=rng.randint(1, 500))
+        msg = "".join(rng.choice(alphabet)
+                      for _ in range(rng.randint(20, 120)))
+        if legacy:
+            stamp = ts.replace(tzinfo=None).isoformat(sep=" ")
+            lines.append(f"[{stamp}]: {msg}\n")
+        else:
+            lines.append(f"{ts.isoformat(timespec='milliseconds')} {msg}\n")
+    return lines
+
+
+def lines_per_second(parse: Callable, lines: List[str], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            parse(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best
+
+
+def main():
+    opts = docopt.docopt(__doc__)
+    count = int(opts['--lines'])
+    repeat = int(opts['--repeat'])
+
+    for name, legacy in (("serial-logger format", False),
+                         ("legacy localtime format", True)):
+        lines = generate_lines(count, legacy=legacy)
+        assert all(parse_log_line(ll) == legacy_parse_log_line(ll)
+                   for ll in lines[:1000])
+        before = lines_per_second(legacy_parse_log_line, lines, repeat)
+        after = lines_per_second(parse_log_line, lines, repeat)
+        print(f"{name}: before {before:,.0f} lines/s, "
+              f"after {after:,.0f} lines/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Usage: bench_pipeline.py [options]
+
+Measure PutLogEvents requests/sec of `ChunkUploader` on a saturated backlog
+when each request takes LATENCY seconds and reading and parsing the events of
+a batch takes CPU seconds, with and without pipelining.
+
+Options:
+  --latency SECONDS    Simulated round-trip time of a request. [default: 0.2]
+  --cpu SECONDS        Simulated time to read and parse a batch. [default: 0.15]
+  --requests NUM       Number of requests to make. [default: 15]
+  --min-time SECONDS   Minimum time between requests. [default: 0.2]
+"""
+import datetime
+import time
+from unittest import mock
+
+import docopt
+
+from metsuri.log_uploader import ChunkUploader, Event, UPLOAD_PIPELINE_DEPTH
+
+
+def requests_per_second(latency, cpu, requests, min_time, pipeline_depth):
+    def upload_batch(client, group, stream, batch, token):
+        time.sleep(latency)
+        return token
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with mock.patch('metsuri.log_uploader.upload_batch', upload_batch):
+        uploader = ChunkUploader(None, "group", "stream", "", min_time, 100,
+                                 60, pipeline_depth=pipeline_depth)
+        start = time.perf_counter()
+        for ii in range(requests * 100):
+            if ii % 100 == 0:
+                busy_until = time.perf_counter() + cpu
+                while time.perf_counter() < busy_until:
+                    pass
+            uploader.append(Event(now, f"line {ii}"))
+        uploader.close()
+        return requests / (time.perf_counter() - start)
+
+
+def main():
+    opts = docopt.docopt(__doc__)
+    args = float(opts['--latency']), float(opts['--cpu']), int(opts['--requests']), \
+        float(opts['--min-time'])
+    before = requests_per_second(*args, pipeline_depth=0)
+    after = requests_per_second(*args, pipeline_depth=UPLOAD_PIPELINE_DEPTH)
+    print(f"uploads: before {before:.2f} req/s, after {after:.2f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Followers wait for a log file to grow or to be replaced by a new file with
+the same name, as happens when `LogFile.rotate_logs` rotates it.
+
+On Linux, inotify is used to wake up as soon as the file changes. Elsewhere,
+or if inotify is not available, the file is polled.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+
+_event_header = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    name: str
+
+
+class Inotify:
+    """
+    Minimal ctypes wrapper around the Linux inotify API.
+    """
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self, timeout: Optional[float] = None) -> List[InotifyEvent]:
+        """
+        Wait up to `timeout` seconds, forever if None, for events to arrive
+        and return them.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, name_len = _event_header.unpack_from(data, pos)
+            pos += _event_header.size
+            name = os.fsdecode(data[pos:pos + name_len].rstrip(b"\0"))
+            pos += name_len
+            events.append(InotifyEvent(wd, mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingFollower:
+    def __init__(self, name: str, inode: int):
+        self.name = name
+        self.inode = inode
+
+    def wait(self) -> bool:
+        """
+        Wait for the file to be appended to. Return True if the file has been
+        replaced by a new file with the same name.
+        """
+        if os.path.exists(self.name) and os.stat(self.name).st_ino != self.inode:
+            return True
+        time.sleep(POLL_INTERVAL)
+        return False
+
+    def close(self):
+        pass
+
+
+class InotifyFollower:
+    def __init__(self, name: str, inode: int):
+        self.inotify = Inotify()
+        try:
+            log_dir, self.base = os.path.split(name)
+            self.inotify.add_watch(name, IN_MODIFY | IN_MOVE_SELF)
+            self.dir_wd = self.inotify.add_watch(log_dir or ".",
+                                                 IN_CREATE | IN_MOVED_TO)
+            self.name = name
+            self.inode = inode
+            # The file could have been rotated before the watch was added.
+            self.rotated = self._replaced()
+        except OSError:
+            self.inotify.close()
+            raise
+
+    def wait(self) -> bool:
+        """
+        Wait for the file to be appended to. Return True if the file has been
+        renamed or a new file with the same name has appeared.
+        """
+        if not self.rotated:
+            for event in self.inotify.read_events():
+                if event.mask & IN_MOVE_SELF:
+                    self.rotated = True
+                elif event.mask & IN_Q_OVERFLOW:
+                    # Events were lost, check the file directly.
+                    self.rotated = self.rotated or self._replaced()
+                elif event.wd == self.dir_wd and event.name == self.base:
+                    self.rotated = True
+        return self.rotated
+
+    def _replaced(self) -> bool:
+        try:
+            return os.stat(self.name).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        self.inotify.close()
+
+
+def open_follower(name: str, inode: int):
+    """
+    Return a follower for the log file `name`, currently opened with `inode`.
+    """
+    if _libc is not None:
+        try:
+            return InotifyFollower(name, inode)
+        except OSError as e:
+            logger.warning(f"Can't use inotify to follow {name}, polling; {e}")
+    return PollingFollower(name, inode)
@@ -1,5 +1,6 @@
 """
 Usage: log-uploader [options] LOG_FILE LOG_GROUP LOG_STREAM
+       log-uploader [options] --config CONFIG
        log-uploader --version
 
 
@@ -7,11 +8,21 @@ This will upload the given log to stream, each line as a log event. Every
 line in the log should start with an '[<ISO8601-TIMESTAMP>]' to allow this
 script to correctly add that data to logged data.
 
+With --config, several logs are uploaded by a single process. CONFIG is an
+INI file with a section for each log file:
+
+    [usb0]
+    log_file = /home/pi/logger/usb0.log
+    log_group = log-group
+    log_stream = usb0-stream
+
 This script assumes we can write data faster towards AWS than it is being
 generated by the serial logger to the log file(s).
 
 Options:
   --watch              Stay on foreground and upload new events.
+  --workers NUM        Maximum number of concurrent uploads with --config.
+                       [default: 4]
   --ignore-timestamp   Ignore stored timestamp and upload all events.
   --verbose            Enable verbose logging.
 """
@@ -25,14 +36,40 @@ import time
 import datetime
 import re
 import itertools
-from typing import Optional, NamedTuple, Iterable
+import functools
+import array
+import mmap
+from typing import Optional, NamedTuple, Iterable, List
 import multiprocessing as mp
 import queue
+import threading
+import collections
+import configparser
+import botocore.config
 from pathlib import Path
+from metsuri.follow import open_follower
 
 TIMESTAMP_FILE_SUFFIX = ".lus"
 AWS_MAX_BATCH_SIZE = 1048576
 AWS_MAX_EVENT_TIME_SPAN = 24 * 3600
+AWS_MAX_EVENTS_IN_BATCH = 10000
+# How much of the log is read backwards from a checkpoint offset to verify
+# it still points to the end of the same log event.
+CHECKPOINT_VERIFY_SIZE = 65536
+# Events are passed from the reader process in chunks of at most this many
+# events, and at most this many chunks are queued before the reader blocks.
+EVENT_CHUNK_SIZE = 1000
+EVENT_QUEUE_DEPTH = 16
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+# Finished batches waiting for upload while the next one is being filled.
+UPLOAD_PIPELINE_DEPTH = 2
+# Requests that can be made back to back after a pause, within the
+# average rate given by the minimum time between requests.
+REQUEST_BURST = 2
+# Concurrent requests when uploading several logs from one process.
+UPLOAD_WORKERS = 4
 
 logger = logging.getLogger(__name__)
 
@@ -50,7 +87,10 @@ class ChunkUploader:
                  max_time_between_uploads: float,
                  max_batch_size: int = AWS_MAX_BATCH_SIZE,
                  max_event_time_span: int = AWS_MAX_EVENT_TIME_SPAN,
-                 timestamp_file_name: Optional[str] = None):
+                 timestamp_file_name: Optional[str] = None,
+                 pipeline_depth: int = 0,
+                 scheduler: Optional["UploadScheduler"] = None,
+                 request_burst: int = 1):
         self.batch = []
         self.min_time_between_requests = min_time_between_requests
         self.max_time_between_uploads = max_time_between_uploads
@@ -63,13 +103,29 @@ class ChunkUploader:
 
         self.timestamp_file_name = timestamp_file_name
         self.upload_sequence_token = upload_sequence_token
-        self._last_event_ts = None
+        self._last_event = None
         self._current_batch_size = 0
         self.max_lines_in_batch = max_lines_in_batch
+        self._bucket = TokenBucket(
+            1 / min_time_between_requests if min_time_between_requests > 0 else None,
+            burst=request_burst)
+        # While catching up with a backlog, batches are filled as far as
+        # the service allows instead of uploading them every
+        # `max_time_between_uploads` seconds.
+        self.backlog = False
+
+        # With pipelining, finished batches are uploaded in order by a
+        # worker thread while the next batch is being filled.
+        self._scheduler = scheduler
+        self._owns_scheduler = False
+        self._worker_error = None
+        if scheduler is None and pipeline_depth > 0:
+            self._scheduler = UploadScheduler(workers=1, max_pending=pipeline_depth)
+            self._owns_scheduler = True
 
     def append(self, event):
         # Timestamps need to be increasing in a batch.
-        if self._last_event_ts and self._last_event_ts > event.timestamp:
+        if self._last_event and self._last_event.timestamp > event.timestamp:
             self.upload_current_batch()
 
         if self.batch and (event.timestamp - self.batch[0].timestamp) > datetime.timedelta(seconds=self.max_event_time_span):
@@ -83,25 +139,42 @@ class ChunkUploader:
         if event.message:
             self.batch.append(event)
             self._current_batch_size += event_size
-        self._last_event_ts = event.timestamp
+        self._last_event = event
 
         self.maybe_upload()
 
     def maybe_upload(self):
-        if len(self.batch) >= self.max_lines_in_batch:
+        self._raise_worker_error()
+        if self.backlog:
+            if len(self.batch) >= AWS_MAX_EVENTS_IN_BATCH:
+                self.upload_current_batch()
+        elif len(self.batch) >= self.max_lines_in_batch:
             self.upload_current_batch()
         else:
             elapsed = self._elapsed()
             if elapsed and elapsed > self.max_time_between_uploads:
                 self.upload_current_batch()
 
-    def _update_timestamp(self, ts: datetime.datetime):
+    def idle(self):
+        """
+        Called when the reader has caught up with the log. Uploads the current
+        batch right away, if that can be done without waiting for the request
+        quota or earlier uploads, to keep latency low while tailing the log.
+        """
+        self.backlog = False
+        if self.batch and self.next_request_time() <= time.time() and \
+                (self._scheduler is None or self._scheduler.is_idle(self)):
+            self.upload_current_batch()
+        else:
+            self.maybe_upload()
+
+    def _update_checkpoint(self, event: "Event"):
         if not self.timestamp_file_name:
             return
 
         try:
             with open(self.timestamp_file_name, "w") as fp:
-                fp.write(ts.isoformat())
+                fp.write(format_checkpoint(event))
         except PermissionError:
             logger.debug("Can't write timestamp file")
 
@@ -109,6 +182,40 @@ class ChunkUploader:
         if not self.batch:
             return
 
+        if self._scheduler is None:
+            self._upload(self.batch, self._last_event)
+        else:
+            self._raise_worker_error()
+            # Blocks if the workers are falling behind.
+            self._scheduler.submit(self, self.batch, self._last_event)
+        self.batch = []
+        self.prev_ts = time.time()
+        self._current_batch_size = 0
+
+    def close(self):
+        """
+        Upload the current batch and wait for pending uploads to finish.
+        """
+        self.upload_current_batch()
+        if self._scheduler is not None:
+            self._scheduler.wait(self)
+            if self._owns_scheduler:
+                self._scheduler.close()
+                self._scheduler = None
+            self._raise_worker_error()
+
+    def next_request_time(self) -> float:
+        """
+        Return the earliest time the next request can be made without
+        exceeding the request quota.
+        """
+        return self._bucket.next_available()
+
+    def _raise_worker_error(self):
+        if self._worker_error is not None:
+            raise self._worker_error
+
+    def _upload(self, batch, last_event: "Event"):
         self._maybe_throttle()
         logger.debug(f"Uploading batch")
 
@@ -134,23 +241,31 @@ class ChunkUploader:
         # There is a quota of 5 requests per second per log stream.
         # Additional requests are throttled. This quota can't be changed.
 
-        self.upload_sequence_token = upload_batch(self.client, self.group,
-                                                  self.stream, self.batch,
-                                                  self.upload_sequence_token)
-        self._update_timestamp(self._last_event_ts)
-        self.batch = []
-        self.prev_ts = time.time()
-        self._current_batch_size = 0
+        while True:
+            self._maybe_throttle()
+            try:
+                self.upload_sequence_token = upload_batch(self.client, self.group,
+                                                          self.stream, batch,
+                                                          self.upload_sequence_token)
+            except botocore.exceptions.ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ThrottlingException':
+                    raise
+                self._bucket.throttled()
+                logger.warning(f"Request was throttled, backing off for "
+                               f"{self._bucket.backoff_time}s")
+                continue
+            self._bucket.succeeded()
+            break
+        self._update_checkpoint(last_event)
 
     def _maybe_throttle(self):
-        if self.prev_ts is not None:
-            elapsed = self._elapsed()
-            if elapsed < self.min_time_between_requests:
-                throttle_seconds = self.min_time_between_requests - elapsed
-                logger.info(
-                    f"Throttling for {throttle_seconds}s to avoid hitting "
-                    f"request quota")
-                time.sleep(throttle_seconds)
+        throttle_seconds = self._bucket.next_available() - time.time()
+        if throttle_seconds > 0:
+            logger.info(
+                f"Throttling for {throttle_seconds}s to avoid hitting "
+                f"request quota")
+            time.sleep(throttle_seconds)
+        self._bucket.take()
 
     def _elapsed(self):
         if not self.prev_ts:
@@ -160,14 +275,232 @@ class ChunkUploader:
             return elapsed
 
 
+class TokenBucket:
+    """
+    Token bucket request rate limiter. Allows `rate` requests per second on
+    average, and bursts of up to `burst` requests. A rate of None allows any
+    number of requests.
+
+    After a request has been throttled by the service, further requests are
+    held back for an exponentially growing time until a request succeeds.
+    """
+
+    def __init__(self, rate: Optional[float], burst: int = 1,
+                 max_backoff: float = 60):
+        self.rate = rate
+        self.burst = burst
+        self.max_backoff = max_backoff
+        self.backoff_time = 0
+        self._tokens = burst
+        self._updated = time.time()
+        self._backoff_until = 0
+
+    def _tokens_at(self, now: float) -> float:
+        if self.rate is None:
+            return self.burst
+        return min(self.burst, self._tokens + (now - self._updated) * self.rate)
+
+    def next_available(self) -> float:
+        """
+        Return the earliest time a request can be made.
+        """
+        now = time.time()
+        tokens = self._tokens_at(now)
+        if tokens >= 1:
+            available = now
+        else:
+            available = now + (1 - tokens) / self.rate
+        return max(available, self._backoff_until)
+
+    def take(self):
+        """
+        Take a token for a request about to be made.
+        """
+        now = time.time()
+        self._tokens = self._tokens_at(now) - 1
+        self._updated = now
+
+    def throttled(self):
+        if self.backoff_time:
+            self.backoff_time = min(self.max_backoff, self.backoff_time * 2)
+        else:
+            self.backoff_time = 1 / self.rate if self.rate else 0.2
+        self._backoff_until = time.time() + self.backoff_time
+        self._tokens = min(self._tokens, 0)
+
+    def succeeded(self):
+        self.backoff_time = 0
+
+
+class UploadScheduler:
+    """
+    Upload finished batches of one or more `ChunkUploader`s with a pool of
+    worker threads.
+
+    Streams with pending batches are served round-robin. Each stream has at
+    most one request in flight, keeping its batches and sequence tokens in
+    order, and is not picked before its minimum time between requests has
+    passed, so a throttled stream does not hold up a worker.
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = UPLOAD_PIPELINE_DEPTH):
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._ready = collections.deque()
+        self._in_flight = set()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work,
+                                          name=f"upload-worker-{ii}",
+                                          daemon=True)
+                         for ii in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, uploader: ChunkUploader, batch, last_event: "Event"):
+        """
+        Queue `batch` for upload by `uploader`. Blocks while the uploader
+        already has `max_pending` batches waiting.
+        """
+        with self._cond:
+            pending = self._pending.setdefault(uploader, collections.deque())
+            while len(pending) >= self.max_pending:
+                self._cond.wait()
+            pending.append((batch, last_event))
+            if len(pending) == 1 and uploader not in self._in_flight:
+                self._ready.append(uploader)
+            self._cond.notify_all()
+
+    def is_idle(self, uploader: ChunkUploader) -> bool:
+        """
+        Return True if `uploader` has no batches waiting or being uploaded.
+        """
+        with self._cond:
+            return not self._pending.get(uploader) and uploader not in self._in_flight
+
+    def wait(self, uploader: ChunkUploader):
+        """
+        Wait until all batches of `uploader` have been uploaded.
+        """
+        with self._cond:
+            while self._pending.get(uploader) or uploader in self._in_flight:
+                self._cond.wait()
+
+    def close(self):
+        """
+        Upload all pending batches and stop the workers.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def _next_job(self):
+        # Called with the lock held.
+        while True:
+            now = time.time()
+            wake_up = None
+            for uploader in self._ready:
+                next_request_time = uploader.next_request_time()
+                if next_request_time <= now:
+                    self._ready.remove(uploader)
+                    self._in_flight.add(uploader)
+                    batch, last_event = self._pending[uploader].popleft()
+                    self._cond.notify_all()
+                    return uploader, batch, last_event
+                if wake_up is None or next_request_time < wake_up:
+                    wake_up = next_request_time
+            if self._closed and not self._ready and not self._in_flight:
+                return None
+            self._cond.wait(None if wake_up is None else wake_up - now)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None:
+                return
+            uploader, batch, last_event = job
+            try:
+                uploader._upload(batch, last_event)
+            except Exception as e:
+                logger.error(f"Upload to {uploader.stream} failed; {e}")
+                uploader._worker_error = e
+            with self._cond:
+                self._in_flight.discard(uploader)
+                if uploader._worker_error is not None:
+                    # Sequence would be broken, drop the rest.
+                    self._pending[uploader].clear()
+                elif self._pending[uploader]:
+                    self._ready.append(uploader)
+                self._cond.notify_all()
+
+
 class EOF:
     pass
 
 
-def log_entry_producer(q, log_filename, watch: bool = False, read_timestamp: bool = True):
+class EventChunk:
+    """
+    Events packed for passing between processes in one go. Timestamps are
+    kept as microseconds since epoch and file positions in arrays, and the
+    messages are joined to a single string when pickled.
+
+    `caught_up` tells whether the reader had reached the end of the log
+    when the chunk was sent.
+    """
+
+    def __init__(self):
+        self.timestamps = array.array('q')
+        self.inodes = array.array('Q')
+        self.offsets = array.array('q')
+        self.messages = []
+        self.caught_up = False
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, event: "Event"):
+        self.timestamps.append((event.timestamp - EPOCH) // ONE_MICROSECOND)
+        self.inodes.append(event.inode or 0)
+        self.offsets.append(event.offset or 0)
+        self.messages.append(event.message)
+
+    def __iter__(self):
+        for us, inode, offset, message in zip(self.timestamps, self.inodes,
+                                              self.offsets, self.messages):
+            yield Event(EPOCH + datetime.timedelta(microseconds=us), message,
+                        inode, offset)
+
+    def __getstate__(self):
+        # Messages never contain line feeds, as they are read line by line.
+        return (self.timestamps, self.inodes, self.offsets, "\n".join(self.messages),
+                self.caught_up)
+
+    def __setstate__(self, state):
+        self.timestamps, self.inodes, self.offsets, messages, self.caught_up = state
+        self.messages = messages.split("\n") if self.timestamps else []
+
+
+def log_entry_producer(q, log_filename, watch: bool = False, read_timestamp: bool = True,
+                       chunk_size: int = EVENT_CHUNK_SIZE):
     try:
-        for ev in get_log_entries(log_filename, watch=watch, read_timestamp=read_timestamp):
-            q.put(ev)
+        chunk = EventChunk()
+        for ev in get_log_entries(log_filename, watch=watch, read_timestamp=read_timestamp,
+                                  yield_idle=True):
+            if ev is not None:
+                chunk.append(ev)
+                if len(chunk) < chunk_size:
+                    continue
+            # Chunk is full, or reader is waiting for more input.
+            if chunk:
+                chunk.caught_up = ev is None
+                q.put(chunk)
+                chunk = EventChunk()
+        if chunk:
+            chunk.caught_up = True
+            q.put(chunk)
         q.put(EOF())
     except Exception as e:
         q.put(e)
@@ -180,7 +513,8 @@ def upload_log(name: str, group: str, stream: str, watch: bool = False,
                max_lines_in_batch: int = 5000,
                max_batch_size: int = AWS_MAX_BATCH_SIZE,
                timestamp_file_name: Optional[str] = None,
-               read_timestamp: bool = True):
+               read_timestamp: bool = True,
+               pipeline_depth: int = UPLOAD_PIPELINE_DEPTH):
     """
 
     :param name: Name of the log file.
@@ -193,6 +527,7 @@ def upload_log(name: str, group: str, stream: str, watch: bool = False,
     :param max_batch_size: Maximum size, in bytes, for a single batch.
     :param timestamp_file_name: Timestamp file name, leave as None for default.
     :param read_timestamp: If True, skip events while events have earlier time than the timestamp found in the `timestamp_file_name`.
+    :param pipeline_depth: Number of finished batches that can wait for upload while the next one is filled. Zero uploads synchronously.
     :return:
     """
     client = boto3.client('logs')
@@ -206,14 +541,29 @@ def upload_log(name: str, group: str, stream: str, watch: bool = False,
                              max_lines_in_batch,
                              max_time_between_uploads,
                              max_batch_size,
-                             timestamp_file_name=timestamp_file_name)
+                             timestamp_file_name=timestamp_file_name,
+                             pipeline_depth=pipeline_depth,
+                             request_burst=REQUEST_BURST)
 
-    q = mp.Queue()
+    q = mp.Queue(maxsize=EVENT_QUEUE_DEPTH)
     producer = mp.Process(target=log_entry_producer, args=(q, name),
                           kwargs={'watch': watch, 'read_timestamp': read_timestamp})
     producer.daemon = True
     producer.start()
 
+    consume_events(q, uploader, producer, max_time_between_uploads)
+
+    logger.info("stopping")
+    uploader.close()
+    q.close()
+    producer.join()
+
+
+def consume_events(q, uploader: ChunkUploader, producer, max_time_between_uploads: float):
+    """
+    Pass events from `q`, filled by `log_entry_producer` running in
+    `producer`, to `uploader` until the producer is done.
+    """
     while True:
         try:
             ev = q.get(block=True, timeout=max(max_time_between_uploads/5, 0.1))
@@ -224,18 +574,121 @@ def upload_log(name: str, group: str, stream: str, watch: bool = False,
                 logger.error(f"Reader encountered error; {ev}", exc_info=ev)
                 break
             else:
-                logger.debug(f"got line {ev.message}")
-                uploader.append(ev)
+                logger.debug(f"got {len(ev)} events")
+                uploader.backlog = not ev.caught_up
+                for event in ev:
+                    uploader.append(event)
+                if ev.caught_up:
+                    uploader.idle()
         except queue.Empty:
-            uploader.maybe_upload()
+            uploader.idle()
             if not producer.is_alive():
                 logger.error("Producer seems to have died.")
                 break
 
+
+class StreamConfig(NamedTuple):
+    log_file: str
+    log_group: str
+    log_stream: str
+
+
+def read_config(filename: str) -> List[StreamConfig]:
+    """
+    Read log files and their destinations from an INI file, with a section
+    for each log file:
+
+        [usb0]
+        log_file = /home/pi/logger/usb0.log
+        log_group = log-group
+        log_stream = usb0-stream
+    """
+    parser = configparser.ConfigParser()
+    with open(filename) as fp:
+        parser.read_file(fp)
+
+    streams = []
+    for name in parser.sections():
+        section = parser[name]
+        try:
+            streams.append(StreamConfig(section['log_file'],
+                                        section['log_group'],
+                                        section['log_stream']))
+        except KeyError as e:
+            raise ValueError(f"Section [{name}] in {filename} is missing {e}")
+    if not streams:
+        raise ValueError(f"No log files configured in {filename}")
+    return streams
+
+
+def upload_logs(streams: List[StreamConfig], watch: bool = False,
+                max_time_between_uploads: float = 5,
+                min_time_between_requests: float = 0.2,
+                max_lines_in_batch: int = 5000,
+                max_batch_size: int = AWS_MAX_BATCH_SIZE,
+                read_timestamp: bool = True,
+                workers: int = UPLOAD_WORKERS):
+    """
+    Upload several log files, each to its own stream, in a single process.
+
+    Each log file is read in its own thread. The streams share one client
+    and a pool of `workers` upload threads, which serve the streams in turn
+    while keeping each within its request quota.
+
+    :param streams: Log files and their destinations.
+    :param workers: Maximum number of concurrent requests.
+
+    See `upload_log` for the rest of the parameters.
+    """
+    client = boto3.client('logs', config=botocore.config.Config(
+        max_pool_connections=workers))
+    scheduler = UploadScheduler(workers=workers)
+    errors = []
+
+    def upload_stream(config: StreamConfig, uploader: ChunkUploader):
+        q = queue.Queue(maxsize=EVENT_QUEUE_DEPTH)
+        producer = threading.Thread(target=log_entry_producer,
+                                    args=(q, config.log_file),
+                                    kwargs={'watch': watch,
+                                            'read_timestamp': read_timestamp},
+                                    name=f"reader-{config.log_stream}",
+                                    daemon=True)
+        producer.start()
+        try:
+            consume_events(q, uploader, producer, max_time_between_uploads)
+            uploader.close()
+        except Exception as e:
+            logger.error(f"Uploading {config.log_file} failed; {e}", exc_info=e)
+            errors.append(e)
+
+    threads = []
+    for config in streams:
+        upload_sequence_token = get_next_sequence_token(client, config.log_group,
+                                                        config.log_stream)
+        uploader = ChunkUploader(client, config.log_group, config.log_stream,
+                                 upload_sequence_token,
+                                 min_time_between_requests,
+                                 max_lines_in_batch,
+                                 max_time_between_uploads,
+                                 max_batch_size,
+                                 timestamp_file_name=get_stamp_filename(config.log_file),
+                                 scheduler=scheduler,
+                                 request_burst=REQUEST_BURST)
+        threads.append(threading.Thread(target=upload_stream,
+                                        args=(config, uploader),
+                                        name=f"uploader-{config.log_stream}",
+                                        daemon=True))
+
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads) and not errors:
+        for thread in threads:
+            thread.join(timeout=1)
+
     logger.info("stopping")
-    uploader.upload_current_batch()
-    q.close()
-    producer.join()
+    scheduler.close()
+    if errors:
+        raise errors[0]
 
 
 def upload_batch(client, group, stream, batch, token):
@@ -273,13 +726,52 @@ def get_next_sequence_token(client, group, stream):
 class Event(NamedTuple):
     timestamp: datetime.datetime
     message: str
+    # Inode of the log file and offset just past the line the event was read
+    # from, if known.
+    inode: Optional[int] = None
+    offset: Optional[int] = None
+
+
+class Checkpoint(NamedTuple):
+    timestamp: datetime.datetime
+    inode: Optional[int] = None
+    offset: Optional[int] = None
 
 
-def parse_log_line(line: Optional[str]) -> Optional[Event]:
+# LogFile.format_line writes fixed width UTC timestamps with millisecond
+# precision, e.g. "2021-01-24T19:13:15.501+00:00 message". Lines in that
+# format are recognized by their fixed separator positions and parsed
+# without the tolerant, unanchored search below.
+FAST_TIMESTAMP_LENGTH = 29
+timestamp_pattern = re.compile(
+    r"(?P<timestamp>\d+-\d+-\d+[T ]\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}:\d{2})?)]?:? ?(?P<msg>.*$)")
+
+
+@functools.lru_cache(maxsize=256)
+def _local_tzinfo(year: int, month: int, day: int, hour: int) -> datetime.tzinfo:
+    # Local UTC offset can only change on an hour boundary, so resolving it
+    # once per hour is enough.
+    return datetime.datetime(year, month, day, hour).astimezone().tzinfo
+
+
+def parse_log_line(line: Optional[str], inode: Optional[int] = None,
+                   offset: Optional[int] = None) -> Optional[Event]:
     if line is None:
         return None
 
-    m = re.search(r"(?P<timestamp>\d+-\d+-\d+[T ]\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}:\d{2})?)]?:? ?(?P<msg>.*$)", line)
+    if line[FAST_TIMESTAMP_LENGTH:FAST_TIMESTAMP_LENGTH + 1] == " " and line[10:11] == "T":
+        try:
+            dt = datetime.datetime.fromisoformat(line[:FAST_TIMESTAMP_LENGTH])
+        except ValueError:
+            # Not in the format written by LogFile, or broken; let the
+            # tolerant parser decide.
+            dt = None
+        if dt is not None and dt.tzinfo is not None:
+            if line[-1] == "\n":
+                return Event(dt, line[FAST_TIMESTAMP_LENGTH + 1:-1], inode, offset)
+            return Event(dt, line[FAST_TIMESTAMP_LENGTH + 1:], inode, offset)
+
+    m = timestamp_pattern.search(line)
     if m is None:
         logger.warning(f"line \"{line}\" did not match when finding timestamp")
         return None
@@ -293,53 +785,114 @@ def parse_log_line(line: Optional[str]) -> Optional[Event]:
 
     if dt.tzinfo is None:
         # Treat as old format localtime log timestamp
-        dt = dt.astimezone()
+        dt = dt.replace(tzinfo=_local_tzinfo(dt.year, dt.month, dt.day, dt.hour))
     msg = m.group("msg")
-    return Event(timestamp=dt, message=msg)
+    return Event(timestamp=dt, message=msg, inode=inode, offset=offset)
 
 
-def get_log_entries(name: str, watch: bool = False, read_timestamp: bool = True) -> Iterable[Event]:
+def get_log_entries(name: str, watch: bool = False, read_timestamp: bool = True,
+                    yield_idle: bool = False) -> Iterable[Optional[Event]]:
     """
     Return a generator yielding log events. If `watch` is True, tracks file
     changes to continue reading from a newly created file with the same name.
 
+    If `read_timestamp` is True, reading continues from the checkpoint in
+    the timestamp file. When the log file is still the one the checkpoint
+    was written for, reading starts directly from the stored byte offset.
+    Otherwise the file is read from the beginning, skipping events up to
+    the stored timestamp. Rotated logs that have not been fully read by the
+    time of the checkpoint are read first, oldest first.
+
     :param name:
     :param watch:
     :param read_timestamp:
+    :param yield_idle: If True, yield None whenever the reader is about to wait for more data.
     :return:
     """
     if read_timestamp:
-        timestamp = get_timestamp(name)
+        checkpoint = get_checkpoint(name)
     else:
-        timestamp = None
+        checkpoint = None
+    skip_until = None
 
-    def get_lines(fp):
-        line = "start"
-        while line or watch:
+    def get_lines(fp, follower):
+        partial = b""
+        rotated = False
+        while True:
             line = fp.readline()
-            if line:
+            if line[-1:] == b"\n":
+                if partial:
+                    line = partial + line
+                    partial = b""
                 yield line
+            elif line:
+                # Logger has not finished writing the line yet.
+                partial += line
+            elif follower and not rotated:
+                yield None
+                # in case file is just being rotated. Lines written before
+                # the rotation are still read from the old file.
+                rotated = follower.wait()
             else:
-                if watch:
-                    # in case file is just being rotated.
-                    if os.path.exists(name) and os.stat(name).st_ino != current_inode:
-                        return
-                    else:
-                        time.sleep(0.5)
-                        continue
-                else:
-                    return None
+                if partial:
+                    yield partial
+                return
+
+    def read_events(fp, follower=None):
+        nonlocal checkpoint, skip_until
+        current_inode = os.fstat(fp.fileno()).st_ino
+        offset = 0
+        if checkpoint is not None:
+            if _seek_to_checkpoint(fp, current_inode, checkpoint):
+                offset = checkpoint.offset
+            else:
+                skip_until = checkpoint.timestamp
+            checkpoint = None
+
+        if follower is None:
+            lines = _read_lines(fp)
+        else:
+            lines = get_lines(fp, follower)
+        for line in lines:
+            if line is None:
+                if yield_idle:
+                    yield None
+                continue
+            offset += len(line)
+            event = parse_log_line(line.decode(errors="backslashreplace"),
+                                   current_inode, offset)
+            if event is None:
+                continue
+            if skip_until is not None:
+                if event.timestamp <= skip_until:
+                    continue
+                skip_until = None
+            yield event
+
+    if checkpoint is not None:
+        for rotated_name in get_unsent_rotated_logs(name, checkpoint):
+            logger.info(f"Reading rotated log {rotated_name}")
+            try:
+                with open(rotated_name, "rb") as logfile:
+                    yield from read_events(logfile)
+            except FileNotFoundError:
+                logger.warning(f"Rotated log {rotated_name} was removed before it was read")
 
     while True:
         try:
-            current_inode = os.stat(name).st_ino
-            with open(name, errors="backslashreplace") as logfile:
-                for event in itertools.dropwhile(
-                        lambda arg: timestamp is not None and arg and arg.timestamp <= timestamp,
-                        filter(None, (parse_log_line(line) for line in get_lines(logfile)))):
-                    yield event
+            with open(name, "rb") as logfile:
+                if watch:
+                    follower = open_follower(name, os.fstat(logfile.fileno()).st_ino)
+                    try:
+                        yield from read_events(logfile, follower)
+                    finally:
+                        follower.close()
+                else:
+                    yield from read_events(logfile)
         except OSError as e:
             if e.errno == 2:
+                if yield_idle:
+                    yield None
                 time.sleep(0.5)
             else:
                 raise
@@ -348,14 +901,138 @@ def get_log_entries(name: str, watch: bool = False, read_timestamp: bool = True)
             return
 
 
-def get_timestamp(name) -> Optional[datetime.datetime]:
+def _read_lines(fp) -> Iterable[bytes]:
+    """
+    Yield the lines of a file that is not being written to, from the current
+    position of `fp` to the end of the file.
+    """
+    position = fp.tell()
+    if position >= os.fstat(fp.fileno()).st_size:
+        return
+    with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        mm.seek(position)
+        yield from iter(mm.readline, b"")
+
+
+def get_rotated_log_suffixes(name: str) -> List[int]:
+    """
+    Return the numeric suffixes of the rotated copies of log `name`, as named
+    by `LogFile.rotate_logs`, oldest first.
+    """
+    log_dir, base = os.path.split(name)
+    prefix = base + "."
+    suffixes = []
+    for fn in os.listdir(log_dir or "."):
+        if fn.startswith(prefix):
+            try:
+                suffixes.append(int(fn[len(prefix):]))
+            except ValueError:
+                pass
+    return sorted(filter(None, suffixes), reverse=True)
+
+
+def get_rotated_logs(name: str) -> List[str]:
+    """
+    Return the rotated copies of log `name`, oldest first.
+    """
+    return [f"{name}.{suffix}" for suffix in get_rotated_log_suffixes(name)]
+
+
+def get_unsent_rotated_logs(name: str, checkpoint: Checkpoint) -> List[str]:
+    """
+    Return the rotated logs of `name` that have events not yet uploaded at
+    `checkpoint`, oldest first.
+
+    If the checkpoint was written for one of the rotated logs, that log and
+    the ones rotated after it are returned. Otherwise, the logs with events
+    newer than the checkpoint timestamp are returned.
+    """
+    rotated = get_rotated_logs(name)
+    inodes = []
+    for rotated_name in rotated + [name]:
+        try:
+            inodes.append(os.stat(rotated_name).st_ino)
+        except FileNotFoundError:
+            inodes.append(None)
+
+    if checkpoint.inode is not None and checkpoint.inode in inodes:
+        return rotated[inodes.index(checkpoint.inode):]
+
+    unsent = []
+    for rotated_name in rotated:
+        last_timestamp = _get_last_timestamp(rotated_name)
+        if unsent or last_timestamp is None or last_timestamp > checkpoint.timestamp:
+            unsent.append(rotated_name)
+    return unsent
+
+
+def _get_last_timestamp(name: str) -> Optional[datetime.datetime]:
+    try:
+        with open(name, "rb") as fp:
+            fp.seek(max(0, os.fstat(fp.fileno()).st_size - CHECKPOINT_VERIFY_SIZE))
+            lines = fp.read().splitlines()
+    except FileNotFoundError:
+        return None
+    for line in reversed(lines):
+        event = parse_log_line(line.decode(errors="backslashreplace"))
+        if event:
+            return event.timestamp
+    return None
+
+
+def _seek_to_checkpoint(fp, inode: int, checkpoint: Checkpoint) -> bool:
+    """
+    Seek `fp` to the checkpoint offset, if the checkpoint was written for
+    this file: the inode must match and the line just before the offset must
+    carry the checkpoint timestamp. Otherwise, rewind `fp` and return False.
+    """
+    if checkpoint.offset is None or checkpoint.inode != inode:
+        return False
+
+    start = max(0, checkpoint.offset - CHECKPOINT_VERIFY_SIZE)
+    fp.seek(start)
+    data = fp.read(checkpoint.offset - start)
+    lines = data.splitlines()
+    if len(data) == checkpoint.offset - start and lines:
+        event = parse_log_line(lines[-1].decode(errors="backslashreplace"))
+        if event and event.timestamp == checkpoint.timestamp:
+            return True
+
+    logger.info("Checkpoint does not match log file contents, skipping "
+                "events by timestamp.")
+    fp.seek(0)
+    return False
+
+
+def get_checkpoint(name) -> Optional[Checkpoint]:
     state_file_name = get_stamp_filename(name)
     if os.path.exists(state_file_name):
-        line = parse_log_line(open(state_file_name).read().strip())
-        if line:
-            return line.timestamp
-        else:
+        with open(state_file_name) as fp:
+            line = parse_log_line(fp.read().strip())
+        if not line:
             return None
+        try:
+            inode, offset = map(int, line.message.split())
+        except ValueError:
+            # Written by an older version, containing only the timestamp.
+            return Checkpoint(line.timestamp)
+        return Checkpoint(line.timestamp, inode, offset)
+    else:
+        return None
+
+
+def format_checkpoint(event: Event) -> str:
+    if event.offset is None:
+        return event.timestamp.isoformat()
+    return f"{event.timestamp.isoformat()} {event.inode} {event.offset}"
+
+
+def get_timestamp(name) -> Optional[datetime.datetime]:
+    checkpoint = get_checkpoint(name)
+    if checkpoint:
+        return checkpoint.timestamp
     else:
         return None
 
@@ -388,8 +1065,14 @@ def main():
                         datefmt="%Y-%m-%dT%H:%M:%S%z"
                         )
 
-    upload_log(opts["LOG_FILE"], opts["LOG_GROUP"], opts["LOG_STREAM"],
-               watch=opts['--watch'], read_timestamp=not opts['--ignore-timestamp'])
+    if opts['--config']:
+        upload_logs(read_config(opts['CONFIG']),
+                    watch=opts['--watch'],
+                    read_timestamp=not opts['--ignore-timestamp'],
+                    workers=int(opts['--workers']))
+    else:
+        upload_log(opts["LOG_FILE"], opts["LOG_GROUP"], opts["LOG_STREAM"],
+                   watch=opts['--watch'], read_timestamp=not opts['--ignore-timestamp'])
     logger.info("exiting")
 
 
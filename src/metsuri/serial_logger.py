@@ -17,7 +17,7 @@ import datetime
 import logging
 from typing import Optional
 from metsuri.log_download import parse_interval
-from metsuri.log_uploader import parse_log_line
+from metsuri.log_uploader import parse_log_line, get_rotated_log_suffixes
 import time
 
 logger = logging.getLogger(__name__)
@@ -49,7 +49,7 @@ class LogFile:
         if cur_pos > 0:
             self.file.seek(0)
             line = self.file.readline()
-            ts, _ = parse_log_line(line)
+            ts = parse_log_line(line).timestamp
             self.file.seek(cur_pos)
         else:
             ts = datetime.datetime.now(datetime.timezone.utc)
@@ -62,24 +62,9 @@ class LogFile:
         self._write_line_internal("**** stopped logging ****")
         self.file.close()
 
-    @staticmethod
-    def _parse_int(string):
-        try:
-            return int(string)
-        except ValueError:
-            return None
-
     def rotate_logs(self):
         self.file.close()
-        log_dir, base = os.path.split(self.filename)
-        log_dir = log_dir if log_dir else "."
-        to_rotate = filter(
-            None,
-            map(lambda fn: self._parse_int(fn[len(base + "."):]),
-                filter(lambda fn: fn.startswith(base + "."),
-                       os.listdir(log_dir))))
-
-        for suffix_int in sorted(to_rotate, reverse=True):
+        for suffix_int in get_rotated_log_suffixes(self.filename):
             filename = f"{self.filename}.{suffix_int}"
             if suffix_int >= self.num_retained_logfiles:
                 os.remove(filename)
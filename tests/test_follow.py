@@ -0,0 +1,66 @@
+from metsuri.follow import InotifyFollower, PollingFollower, open_follower
+from metsuri.log_uploader import get_log_entries
+from metsuri.serial_logger import LogFile
+from unittest import mock
+import os
+import pytest
+import threading
+import time
+
+
+def collect_entries(log_file_name, entries):
+    for event in get_log_entries(log_file_name, watch=True):
+        entries.append(event.message)
+
+
+def wait_for(entries, count, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while len(entries) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return list(entries)
+
+
+@pytest.mark.parametrize("follower_class", [InotifyFollower, PollingFollower])
+def test_watch_follows_rotation(log_file_name, follower_class):
+    entries = []
+    with mock.patch('metsuri.log_uploader.open_follower', follower_class), \
+            LogFile(log_file_name) as log:
+        reader = threading.Thread(target=collect_entries,
+                                  args=(log_file_name, entries), daemon=True)
+        reader.start()
+        assert wait_for(entries, 1) == ["**** started logging ****"]
+
+        log.write_line("foo")
+        log.write_line("bar")
+        log.rotate_logs()
+        log.write_line("baz")
+        assert wait_for(entries, 4)[1:] == ["foo", "bar", "baz"]
+
+
+def test_inotify_follower_detects_rotation_without_polling(log_file_name):
+    with LogFile(log_file_name) as log:
+        follower = open_follower(log_file_name, os.stat(log_file_name).st_ino)
+        try:
+            assert isinstance(follower, InotifyFollower)
+            with mock.patch('os.stat', wraps=os.stat) as mock_stat:
+                log.write_line("foo")
+                assert not follower.wait()
+                log.rotate_logs()
+                assert follower.wait()
+                mock_stat.assert_not_called()
+        finally:
+            follower.close()
+
+
+def test_inotify_follower_wakes_up_on_write(log_file_name):
+    with LogFile(log_file_name) as log:
+        follower = InotifyFollower(log_file_name, os.stat(log_file_name).st_ino)
+        try:
+            writer = threading.Timer(0.1, log.write_line, args=("foo",))
+            start = time.monotonic()
+            writer.start()
+            assert not follower.wait()
+            assert time.monotonic() - start < 0.5
+        finally:
+            writer.join()
+            follower.close()
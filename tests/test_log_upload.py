@@ -1,9 +1,13 @@
-from metsuri.log_uploader import upload_log, ChunkUploader, Event
+from metsuri.log_uploader import upload_log, ChunkUploader, Event, EventChunk, \
+    UploadScheduler, upload_logs, read_config, StreamConfig
 from unittest import mock
 import datetime
 import freezegun
+import os
+import pickle
 import pytest
 import tempfile
+import time
 from contextlib import contextmanager
 
 
@@ -46,7 +50,9 @@ def test_upload_log(log_file_name):
         assert len(mock_upload_batch.call_args_list[2][0][3]) == 2
         assert len(mock_upload_batch.call_args_list[3][0][3]) == 5
 
-        assert datetime.datetime.fromisoformat(open(timestamp_file_name).read())
+        timestamp, inode, offset = open(timestamp_file_name).read().split()
+        assert datetime.datetime.fromisoformat(timestamp)
+        assert int(offset) == len(log_data)
 
     # Deal with:
     # botocore.errorfactory.InvalidParameterException: An error occurred (
@@ -215,3 +221,146 @@ def test_upload_log_with_invalid_timestamp(log_file_name):
         assert len(mock_upload_batch.call_args_list[0][0][3]) == 2
         msg = mock_upload_batch.call_args_list[0][0][3][1].message
         assert "valid again" in msg
+
+
+def test_event_chunk_roundtrip():
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+    events = [Event(datetime.datetime(2021, 1, 24, 19, 12, 35, 143911, tzinfo=tz), "foo", 12, 34),
+              Event(datetime.datetime(2021, 1, 24, 19, 12, 35, 143910, tzinfo=tz), "", 12, 35),
+              Event(datetime.datetime(2021, 1, 24, 19, 12, 36, tzinfo=tz), "bar \\xc2 \r", 12, 60)]
+    chunk = EventChunk()
+    for ev in events:
+        chunk.append(ev)
+    received = list(pickle.loads(pickle.dumps(chunk)))
+    assert received == events
+    assert received[0].timestamp.tzinfo == datetime.timezone.utc
+
+    assert list(pickle.loads(pickle.dumps(EventChunk()))) == []
+
+
+def test_pipelined_uploads():
+    def slow_upload_batch(client, group, stream, batch, token):
+        time.sleep(0.2)
+        return token + "+"
+
+    with mock.patch('metsuri.log_uploader.upload_batch',
+                    side_effect=slow_upload_batch) as mock_upload_batch:
+        uploader = ChunkUploader(mock.MagicMock(), "foo", "bar", "tsap",
+                                 0, 1, 60, pipeline_depth=2)
+        start = time.monotonic()
+        for ii in range(3):
+            uploader.append(Event(timestamp=datetime.datetime.now(), message=f"line {ii}"))
+        # Filling batches does not wait for the requests to complete.
+        assert time.monotonic() - start < 0.2
+        uploader.close()
+
+    assert [[ev.message for ev in call[0][3]] for call in mock_upload_batch.call_args_list] == \
+        [["line 0"], ["line 1"], ["line 2"]]
+    assert [call[0][4] for call in mock_upload_batch.call_args_list] == ["tsap", "tsap+", "tsap++"]
+
+
+def test_pipelined_upload_error():
+    with mock.patch('metsuri.log_uploader.upload_batch',
+                    side_effect=RuntimeError("no network")) as mock_upload_batch:
+        uploader = ChunkUploader(mock.MagicMock(), "foo", "bar", "tsap",
+                                 0, 1, 60, pipeline_depth=2)
+        uploader.append(Event(timestamp=datetime.datetime.now(), message="foo"))
+        with pytest.raises(RuntimeError):
+            for _ in range(100):
+                time.sleep(0.01)
+                uploader.maybe_upload()
+        with pytest.raises(RuntimeError):
+            uploader.close()
+        mock_upload_batch.assert_called_once()
+
+
+def test_read_config(log_file_name):
+    config_file_name = log_file_name + ".ini"
+    with open(config_file_name, "w") as fp:
+        fp.write("""\
+[usb0]
+log_file = /home/pi/logger/usb0.log
+log_group = group
+log_stream = usb0
+
+[usb1]
+log_file = /home/pi/logger/usb1.log
+log_group = group
+log_stream = usb1
+""")
+    assert read_config(config_file_name) == [
+        StreamConfig("/home/pi/logger/usb0.log", "group", "usb0"),
+        StreamConfig("/home/pi/logger/usb1.log", "group", "usb1")]
+
+    with open(config_file_name, "a") as fp:
+        fp.write("[usb2]\nlog_file = usb2.log\n")
+    with pytest.raises(ValueError, match="usb2"):
+        read_config(config_file_name)
+
+
+def test_upload_logs(log_file_name):
+    streams = []
+    for name in ("usb0", "usb1"):
+        file_name = f"{log_file_name}.{name}"
+        with open(file_name, "w") as fp:
+            fp.write(f"2021-01-24T19:13:15.501+00:00 {name} foo\n"
+                     f"2021-01-24T19:13:16.501+00:00 {name} bar\n")
+        streams.append(StreamConfig(file_name, "group", name))
+
+    with mock_aws() as (mock_upload_batch, _):
+        upload_logs(streams, min_time_between_requests=0)
+        uploaded = {call[0][2]: [ev.message for ev in call[0][3]]
+                    for call in mock_upload_batch.call_args_list}
+    assert uploaded == {"usb0": ["usb0 foo", "usb0 bar"],
+                        "usb1": ["usb1 foo", "usb1 bar"]}
+    for config in streams:
+        assert os.path.exists(config.log_file + ".lus")
+
+
+def test_upload_scheduler_is_fair():
+    order = []
+
+    def upload_batch(client, group, stream, batch, token):
+        order.append(stream)
+        time.sleep(0.01)
+        return token
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with mock.patch('metsuri.log_uploader.upload_batch', upload_batch):
+        scheduler = UploadScheduler(workers=1, max_pending=3)
+        busy = ChunkUploader(None, "group", "busy", "", 0, 1, 60, scheduler=scheduler)
+        quiet = ChunkUploader(None, "group", "quiet", "", 0, 1, 60, scheduler=scheduler)
+        for ii in range(3):
+            busy.append(Event(now, f"busy {ii}"))
+        quiet.append(Event(now, "quiet"))
+        busy.close()
+        quiet.close()
+        scheduler.close()
+    # The quiet stream does not wait for the whole backlog of the busy one.
+    assert order.index("quiet") < 3
+
+
+def test_upload_scheduler_rate_limits_each_stream():
+    times = {}
+
+    def upload_batch(client, group, stream, batch, token):
+        times.setdefault(stream, []).append(time.monotonic())
+        return token
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with mock.patch('metsuri.log_uploader.upload_batch', upload_batch):
+        scheduler = UploadScheduler(workers=2, max_pending=3)
+        uploaders = [ChunkUploader(None, "group", name, "", 0.1, 1, 60, scheduler=scheduler)
+                     for name in ("usb0", "usb1")]
+        for ii in range(3):
+            for uploader in uploaders:
+                uploader.append(Event(now, f"line {ii}"))
+        for uploader in uploaders:
+            uploader.close()
+        scheduler.close()
+
+    for stream_times in times.values():
+        assert len(stream_times) == 3
+        assert all(b - a >= 0.09 for a, b in zip(stream_times, stream_times[1:]))
+    # Streams are not throttled by each other's requests.
+    assert abs(times["usb0"][0] - times["usb1"][0]) < 0.05
@@ -2,7 +2,8 @@ from freezegun import freeze_time
 import os
 import datetime
 from metsuri.serial_logger import LogFile, collect_serial_debug
-from metsuri.log_uploader import get_log_entries, get_timestamp
+from metsuri.log_uploader import get_log_entries, get_timestamp, parse_log_line, \
+    get_checkpoint, format_checkpoint
 import unittest.mock as mock
 import pytest
 import serial
@@ -127,6 +128,121 @@ def test_get_timestamp(log_file_name):
                                    tzinfo=datetime.timezone.utc)
 
 
+def test_resume_from_checkpoint(log_file_name):
+    log_data = """\
+2020-01-01T00:00:01.400+00:00 foo
+2020-01-01T00:00:01.500+00:00 bar
+2020-01-01T00:00:01.500+00:00 qux
+2020-01-01T00:00:01.600+00:00 zap
+"""
+    with open(log_file_name, "w") as fp:
+        fp.write(log_data)
+
+    entries = list(get_log_entries(log_file_name))
+    assert entries[-1].offset == len(log_data)
+    assert entries[-1].inode == os.stat(log_file_name).st_ino
+
+    # Events sharing the checkpoint timestamp are not lost.
+    with open(log_file_name + ".lus", "w") as fp:
+        fp.write(format_checkpoint(entries[1]))
+    assert get_checkpoint(log_file_name).offset == entries[1].offset
+    with mock.patch('metsuri.log_uploader.parse_log_line',
+                    wraps=parse_log_line) as mock_parse:
+        resumed = list(get_log_entries(log_file_name))
+    assert [e.message for e in resumed] == ["qux", "zap"]
+    # Only the checkpoint, the line ending at the checkpoint offset and the
+    # new lines are parsed.
+    assert mock_parse.call_count == 4
+
+    # A new file with the same name falls back to skipping by timestamp.
+    os.rename(log_file_name, log_file_name + ".old")
+    with open(log_file_name, "w") as fp:
+        fp.write(log_data + "2020-01-01T00:00:01.700+00:00 zappa\n")
+    resumed = list(get_log_entries(log_file_name))
+    assert [e.message for e in resumed] == ["zap", "zappa"]
+
+
+def test_resume_from_rotated_logs(log_file_name):
+    with freeze_time(datetime.datetime(year=2020, month=1, day=1)) as frozen:
+        with LogFile(log_file_name, rotation_interval=datetime.timedelta(hours=1),
+                     num_retained_logfiles=5) as log:
+            log.write_line("foo 0")
+            entries = list(get_log_entries(log_file_name))
+            with open(log_file_name + ".lus", "w") as fp:
+                fp.write(format_checkpoint(entries[-1]))
+
+            for ii in range(1, 4):
+                frozen.tick(delta=datetime.timedelta(minutes=70))
+                log.write_line(f"foo {ii}")
+    assert os.path.exists(log_file_name + ".3")
+
+    # Continues from the rotated log the checkpoint was written for.
+    resumed = list(get_log_entries(log_file_name))
+    assert [e.message for e in resumed if "foo" in e.message] == ["foo 1", "foo 2", "foo 3"]
+    assert resumed[0].inode == os.stat(log_file_name + ".2").st_ino
+
+    # Without inode, rotated logs with newer events are found by timestamp.
+    with open(log_file_name + ".lus", "w") as fp:
+        fp.write(entries[-1].timestamp.isoformat())
+    resumed = list(get_log_entries(log_file_name))
+    assert [e.message for e in resumed if "foo" in e.message] == ["foo 1", "foo 2", "foo 3"]
+
+    # Nothing new since the checkpoint.
+    with open(log_file_name + ".lus", "w") as fp:
+        fp.write(format_checkpoint(resumed[-1]))
+    assert list(get_log_entries(log_file_name)) == []
+
+
+def test_resume_from_rewritten_file(log_file_name):
+    with open(log_file_name, "w") as fp:
+        fp.write("2020-01-01T00:00:01.400+00:00 foo\n"
+                 "2020-01-01T00:00:01.500+00:00 bar\n")
+    entries = list(get_log_entries(log_file_name))
+    with open(log_file_name + ".lus", "w") as fp:
+        fp.write(format_checkpoint(entries[0]))
+
+    # Same inode, but the checkpoint offset no longer ends the same event.
+    with open(log_file_name, "w") as fp:
+        fp.write("2020-01-01T00:00:01.300+00:00 aardvark\n"
+                 "2020-01-01T00:00:01.500+00:00 bar\n")
+    resumed = list(get_log_entries(log_file_name))
+    assert [e.message for e in resumed] == ["bar"]
+
+
+def test_parse_log_line_fast_path():
+    with freeze_time(datetime.datetime(year=2020, month=1, day=1,
+                                       microsecond=400000)):
+        line = LogFile.format_line("foo: bar ")
+    event = parse_log_line(line)
+    assert event.timestamp == datetime.datetime(year=2020, month=1, day=1,
+                                                microsecond=400000,
+                                                tzinfo=datetime.timezone.utc)
+    assert event.message == "foo: bar"
+
+    assert parse_log_line("2020-01-01T00:00:01.400+00:00 \n").message == ""
+    assert parse_log_line("2020-01-01T00:00:01.400+00:00  x").message == " x"
+    assert parse_log_line("2020-01-01T00:00:01.400+00:00 x\r\n").message == "x\r"
+
+
+def test_parse_log_line_fallback():
+    event = parse_log_line("2020-01-01T00:00:01.400123+00:00 foo\n")
+    assert event.timestamp == datetime.datetime(year=2020, month=1, day=1,
+                                                second=1, microsecond=400123,
+                                                tzinfo=datetime.timezone.utc)
+    assert event.message == "foo"
+
+    local_tzinfo = datetime.datetime(year=2020, month=7, day=1, hour=12).astimezone().tzinfo
+    event = parse_log_line("[2020-07-01 12:00:01.400]: foo bar baz qux quux\n")
+    assert event.timestamp == datetime.datetime(year=2020, month=7, day=1,
+                                                hour=12, second=1,
+                                                microsecond=400000,
+                                                tzinfo=local_tzinfo)
+    assert event.message == "foo bar baz qux quux"
+
+    assert parse_log_line("2020-13-01T00:00:01.400+00:00 foo") is None
+    assert parse_log_line("no timestamp here") is None
+
+
 def test_write_line_returns_written(log_file_name):
     with freeze_time(datetime.datetime(year=2020, month=1, day=1),
                      tz_offset=3) as frozen: